@@ -1,2 +1,3 @@
 BASE_URL = "https://cad.onshape.com/api"
 STEP_HEADERS = {"Accept": "application/json"}
+STREAM_CHUNK_SIZE = 1 << 20
@@ -5,41 +5,255 @@ A pipeline for converting STL surface meshes into volumetric tetrahedral meshes
 This is useful for preprocessing CAD geometry for finite element simulations.
 
 Functions:
+    - weld_vertices
     - create_2d_mesh
+    - is_watertight
+    - fill_small_holes
     - clean_mesh
     - tetrahedralize_mesh
+    - write_vtu
+    - write_vtu_streaming
     - save_mesh_to_vtk
+    - split_bodies
     - stl_to_vtk
 
 Dependencies:
+    - numpy
+    - scipy
     - trimesh
     - tetgen
     - meshio
     - pymeshfix
+    - numba (optional, speeds up weld_vertices)
 
 Author: Marvin Frommer
 Date: 2025-08-05
 """
 
+import contextlib
+import ctypes
+import inspect
+import logging
+import os
+import sys
+import threading
+import warnings
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
 import trimesh
 import tetgen
 import meshio
 import pymeshfix
 from io import BytesIO
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# pymeshfix >= 0.17 moved the verbose flag from repair() to the MeshFix constructor
+_REPAIR_TAKES_VERBOSE = "verbose" in inspect.signature(pymeshfix.MeshFix.repair).parameters
+
+STL_HEADER_SIZE = 84
+STL_RECORD_DTYPE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("v", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+# "normal" is TetGen's own default (minratio 2.0, no dihedral bound); the others only
+# loosen or tighten the quality constraints
+TETGEN_PRESETS = {
+    "draft": {"minratio": 3.0},
+    "normal": {},
+    "fine": {"mindihedral": 20, "minratio": 1.5},
+}
+
+VTK_TETRA = 10
+VTU_CHUNK_ROWS = 1 << 16
+
+STL_ASCII_VERTEX = rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)"
+
+# Relative weld tolerance; 1e-6 of the bounding box keeps every quantized axis within 21 bits
+WELD_TOLERANCE = 1e-6
+# Largest quantized coordinate a 64-bit Morton key can hold per axis
+MORTON_AXIS_LIMIT = (1 << 21) - 1
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _spread_bits(x):
+        x &= 0x1fffff
+        x = (x | x << 32) & 0x1f00000000ffff
+        x = (x | x << 16) & 0x1f0000ff0000ff
+        x = (x | x << 8) & 0x100f00f00f00f00f
+        x = (x | x << 4) & 0x10c30c30c30c30c3
+        x = (x | x << 2) & 0x1249249249249249
+        return x
+
+    @njit(cache=True)
+    def _weld_kernel(vertices, eps):
+        n = vertices.shape[0]
+        lo = np.empty(3)
+        for axis in range(3):
+            lo[axis] = vertices[:, axis].min()
+
+        keys = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            key = np.int64(0)
+            for axis in range(3):
+                q = np.int64(np.floor((vertices[i, axis] - lo[axis]) / eps))
+                key |= _spread_bits(q) << axis
+            keys[i] = key
+
+        order = np.argsort(keys)
+        is_new = np.empty(n, dtype=np.int64)
+        is_new[0] = 1
+        for i in range(1, n):
+            is_new[i] = keys[order[i]] != keys[order[i - 1]]
+        group = np.cumsum(is_new) - 1
+
+        remap = np.empty(n, dtype=np.int64)
+        first = np.empty(group[n - 1] + 1, dtype=np.int64)
+        for i in range(n):
+            remap[order[i]] = group[i]
+            if is_new[i]:
+                first[group[i]] = order[i]
+        return remap, first
+
+
+def _weld_numpy(vertices, eps):
+    q = np.floor((vertices - vertices.min(axis=0)) / eps).astype(np.int64)
+    _, first, remap = np.unique(q, axis=0, return_index=True, return_inverse=True)
+    return remap.reshape(-1), first
+
+
+def weld_vertices(vertices, faces, eps=None):
+    """
+    Merge vertices that fall into the same cell of a quantized coordinate grid.
+
+    Uses a compiled Numba kernel over Morton keys when numba is installed and a
+    vectorized NumPy fallback otherwise, or when eps is so small that the
+    quantized coordinates no longer fit in a Morton key. Faces that collapse are dropped.
+
+    The kernel is deliberately serial: a parallel Numba thread pool makes the
+    fork-based worker pool in stl_to_vtk deadlock.
+
+    Args:
+        vertices (ndarray): Nx3 array of vertex coordinates.
+        faces (ndarray): Mx3 array of face indices.
+        eps (float, optional): Grid cell size. Defaults to WELD_TOLERANCE times the largest bounding box extent.
+
+    Returns:
+        tuple:
+            - vertices (ndarray): Kx3 array of welded vertex coordinates.
+            - faces (ndarray): Mx3 array of face indices into the welded vertices.
+    """
+    if len(vertices) == 0:
+        return vertices, np.asarray(faces, dtype=np.int32)
+    extent = float(np.ptp(vertices, axis=0).max())
+    if eps is None:
+        eps = extent * WELD_TOLERANCE or 1.0
+
+    # Both backends quantize in float64 so they agree on cell boundaries
+    points = np.asarray(vertices, dtype=np.float64)
+    if NUMBA_AVAILABLE and extent / eps < MORTON_AXIS_LIMIT:
+        remap, first = _weld_kernel(points, eps)
+    else:
+        remap, first = _weld_numpy(points, eps)
+
+    faces = remap[faces].astype(np.int32)
+    valid = ((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2])
+             & (faces[:, 2] != faces[:, 0]))
+    return vertices[first], faces[valid]
+
+
+def _binary_triangle_count(stl_data):
+    """
+    Return the triangle count if the data is a well-formed binary STL, else None.
+
+    Binary STL files may also start with b"solid", so the size declared in the
+    header is checked against the payload length instead of relying on the prefix.
+    """
+    if len(stl_data) < STL_HEADER_SIZE:
+        return None
+    n = int(np.frombuffer(stl_data, dtype="<u4", count=1, offset=80)[0])
+    if len(stl_data) != STL_HEADER_SIZE + STL_RECORD_DTYPE.itemsize * n:
+        return None
+    return n
+
+
+def _parse_binary_stl(stl_data, n):
+    """
+    Parse binary STL records in a single vectorized pass.
+
+    Args:
+        stl_data (bytes): Binary STL data.
+        n (int): Number of triangles declared in the header.
+
+    Returns:
+        tuple:
+            - vertices (ndarray): Nx3 array of unique vertex coordinates.
+            - faces (ndarray): Mx3 array of face indices.
+    """
+    records = np.frombuffer(stl_data, dtype=STL_RECORD_DTYPE,
+                            offset=STL_HEADER_SIZE, count=n)
+    # pymeshfix needs a welded mesh, so merge the per-triangle corners
+    vertices = records["v"].reshape(-1, 3)
+    faces = np.arange(3 * n, dtype=np.int32).reshape(-1, 3)
+    return weld_vertices(vertices, faces)
+
+
+def _parse_ascii_stl(stl_data):
+    """
+    Parse ASCII STL vertex lines with a single regex pass.
+
+    Args:
+        stl_data (bytes): ASCII STL data.
+
+    Returns:
+        tuple: (vertices, faces) like _parse_binary_stl, or None if the data
+        does not contain a whole number of triangles.
+    """
+    coords = np.fromregex(BytesIO(stl_data), STL_ASCII_VERTEX,
+                          dtype=[("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+    if len(coords) == 0 or len(coords) % 3:
+        return None
+    vertices = np.stack([coords["x"], coords["y"], coords["z"]], axis=1)
+    faces = np.arange(len(vertices), dtype=np.int32).reshape(-1, 3)
+    return weld_vertices(vertices, faces)
+
 
 def create_2d_mesh(stl_data):
     """
     Load STL data and extract vertices and triangular surface faces.
 
     Args:
-        stl_data (bytes): Binary STL data, e.g., downloaded from an API.
+        stl_data (bytes): Binary or ASCII STL data, e.g., downloaded from an API.
+                          Both are parsed directly with NumPy; trimesh is only used
+                          for ASCII files the regex parser cannot handle.
 
     Returns:
         tuple:
             - vertices (ndarray): Nx3 array of vertex coordinates.
             - faces (ndarray): Mx3 array of face indices.
     """
+    n = _binary_triangle_count(stl_data)
+    if n is not None:
+        return _parse_binary_stl(stl_data, n)
+
+    mesh = _parse_ascii_stl(stl_data)
+    if mesh is not None:
+        return mesh
+
     trimesh_mesh = trimesh.load(BytesIO(stl_data), file_type='stl')
     vertices = trimesh_mesh.vertices
     faces = trimesh_mesh.faces
@@ -47,14 +261,290 @@ def create_2d_mesh(stl_data):
     return vertices, faces
 
 
-def clean_mesh(vertices, faces):
-    meshfix = pymeshfix.MeshFix(vertices, faces)
-    meshfix.repair(verbose=True, joincomp=True,
-                   remove_smallest_components=False)
+def _edge_keys(faces, n_vertices):
+    """
+    Encode every face edge as a single int64 key, min(a, b) * n_vertices + max(a, b).
+
+    Sorting 1-D keys is much faster than np.unique(axis=0) on an Nx2 edge array.
+
+    Returns:
+        tuple:
+            - directed (ndarray): 3Mx2 array of face edges in winding order.
+            - keys (ndarray): Undirected key of each directed edge.
+    """
+    directed = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    lo = directed.min(axis=1).astype(np.int64)
+    return directed, lo * n_vertices + directed.max(axis=1)
+
+
+def _edge_counts(faces, n_vertices):
+    """
+    Count how many faces share each undirected edge.
+
+    Args:
+        faces (ndarray): Mx3 array of face indices.
+        n_vertices (int): Number of vertices, used to encode the edge keys.
+
+    Returns:
+        tuple:
+            - directed (ndarray): 3Mx2 array of face edges in winding order.
+            - keys (ndarray): Sorted unique undirected edge keys.
+            - inverse (ndarray): Index into keys for each directed edge.
+            - counts (ndarray): Number of faces adjacent to each edge.
+    """
+    directed, keys = _edge_keys(faces, n_vertices)
+    keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    return directed, keys, inverse.reshape(-1), counts
+
+
+def _uses_all_vertices(faces, n_vertices):
+    return np.count_nonzero(np.bincount(faces.ravel(), minlength=n_vertices)) == n_vertices
+
+
+def is_watertight(vertices, faces, edges=None):
+    """
+    Check whether a surface mesh is closed and manifold without running a repair.
+
+    Every edge must be shared by exactly two faces and every vertex must be used.
+
+    Args:
+        vertices (ndarray): Nx3 array of vertex coordinates.
+        faces (ndarray): Mx3 array of face indices.
+        edges (tuple, optional): _edge_counts(faces, len(vertices)), if already computed.
+
+    Returns:
+        bool: True if the mesh can be passed to TetGen as-is.
+    """
+    if len(faces) == 0:
+        return False
+    if edges is None:
+        edges = _edge_counts(faces, len(vertices))
+    counts = edges[3]
+    return (counts.min() == 2 and counts.max() == 2
+            and _uses_all_vertices(faces, len(vertices)))
+
+
+def _boundary_loops(faces, edges=None):
+    """
+    Trace the boundary edges of a surface mesh into closed vertex loops.
+
+    Loops follow the reversed face winding, so a fan over a loop is oriented
+    consistently with the surrounding faces.
+
+    Returns:
+        list[ndarray] or None: One array of vertex indices per hole, or None if the
+        boundary is not a set of simple loops (e.g. non-manifold edges).
+    """
+    if edges is None:
+        edges = _edge_counts(faces, int(faces.max()) + 1)
+    directed, _, inverse, counts = edges
+    if counts.max() > 2:
+        return None
+    boundary = directed[counts[inverse] == 1]
+    if len(boundary) == 0:
+        return []
+
+    starts, ends = boundary[:, 1], boundary[:, 0]
+    order = np.argsort(starts)
+    starts, ends = starts[order], ends[order]
+    if np.any(starts[1:] == starts[:-1]):
+        return None
+    next_vertex = dict(zip(starts.tolist(), ends.tolist()))
+
+    loops = []
+    while next_vertex:
+        start, current = next_vertex.popitem()
+        loop = [start]
+        while current != start:
+            loop.append(current)
+            current = next_vertex.pop(current, None)
+            if current is None:
+                return None
+        loops.append(np.array(loop))
+    return loops
+
+
+def _fan_fill(vertices, loop, tolerance=1e-3):
+    """
+    Triangulate a hole loop as a fan from its first vertex.
+
+    Returns None if the loop is not planar and strictly convex, since a fan is
+    only guaranteed to be valid in that case.
+    """
+    if len(loop) < 3:
+        return None
+    points = np.asarray(vertices[loop], dtype=np.float64)
+    points = points - points.mean(axis=0)
+    _, singular, axes = np.linalg.svd(points, full_matrices=False)
+    if singular[0] == 0 or singular[2] > tolerance * singular[0]:
+        return None
+
+    planar = points @ axes[:2].T
+    edges = np.roll(planar, -1, axis=0) - planar
+    turns = edges[:, 0] * np.roll(edges[:, 1], -1) - edges[:, 1] * np.roll(edges[:, 0], -1)
+    if not (np.all(turns > 0) or np.all(turns < 0)):
+        return None
+
+    return np.column_stack([np.full(len(loop) - 2, loop[0]), loop[1:-1], loop[2:]])
+
+
+def fill_small_holes(vertices, faces, max_holes=8, edges=None):
+    """
+    Close a few planar, convex holes with fan triangulations.
+
+    Much cheaper than a full pymeshfix repair for meshes that are watertight
+    apart from a handful of small openings.
+
+    Args:
+        vertices (ndarray): Nx3 array of vertex coordinates.
+        faces (ndarray): Mx3 array of face indices.
+        max_holes (int, optional): Give up if the mesh has more holes than this.
+        edges (tuple, optional): _edge_counts(faces, len(vertices)), if already computed.
+
+    Returns:
+        ndarray or None: Faces including the fill triangles, with every edge shared by
+        exactly two faces, or None if the holes cannot be filled this way and a full
+        repair is needed.
+    """
+    if edges is None:
+        edges = _edge_counts(faces, len(vertices))
+    loops = _boundary_loops(faces, edges)
+    if loops is None or len(loops) > max_holes:
+        return None
+
+    fills = []
+    for loop in loops:
+        fill = _fan_fill(vertices, loop)
+        if fill is None:
+            return None
+        fills.append(fill)
+    if not fills:
+        return faces
+
+    # Only edges touched by the fill change, so check those instead of the whole mesh;
+    # a fan diagonal that already exists elsewhere would become non-manifold
+    _, keys, _, counts = edges
+    _, fill_keys = _edge_keys(np.concatenate(fills), len(vertices))
+    fill_keys, fill_counts = np.unique(fill_keys, return_counts=True)
+    pos = np.minimum(np.searchsorted(keys, fill_keys), len(keys) - 1)
+    existing = np.where(keys[pos] == fill_keys, counts[pos], 0)
+    if np.any(existing + fill_counts != 2):
+        return None
+    return np.concatenate([faces] + fills).astype(np.int32)
+
+
+@contextlib.contextmanager
+def _stdout_to_log():
+    """
+    Redirect file descriptor 1 into a pipe and re-emit each line via logging.DEBUG.
+
+    C extensions write to fd 1 directly, so swapping sys.stdout is not enough.
+    A background thread drains the pipe so the extension never blocks on it.
+    Lines are logged only after fd 1 is restored; a handler writing to stdout
+    would otherwise feed its own output back into the pipe.
+    """
+    sys.stdout.flush()
+    read_fd, write_fd = os.pipe()
+    saved_fd = os.dup(1)
+    os.dup2(write_fd, 1)
+    os.close(write_fd)
+
+    lines = []
+
+    def pump():
+        with os.fdopen(read_fd, "r", errors="replace") as pipe:
+            lines.extend(line.rstrip() for line in pipe)
+
+    thread = threading.Thread(target=pump, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        with contextlib.suppress(Exception):
+            ctypes.CDLL(None).fflush(None)
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+        thread.join()
+        for line in lines:
+            logger.debug(line)
+
+
+def _repair(vertices, faces, verbose, remove_smallest_components):
+    if _REPAIR_TAKES_VERBOSE:
+        meshfix = pymeshfix.MeshFix(vertices, faces)
+        meshfix.repair(verbose=verbose, joincomp=True,
+                       remove_smallest_components=remove_smallest_components)
+    else:
+        meshfix = pymeshfix.MeshFix(vertices, faces, verbose=verbose)
+        meshfix.repair(joincomp=True,
+                       remove_smallest_components=remove_smallest_components)
+    if hasattr(meshfix, "points"):
+        return meshfix.points, meshfix.faces
     return meshfix.v, meshfix.f
 
 
-def tetrahedralize_mesh(vertices, faces, tetgen_options: dict = None):
+def clean_mesh(vertices, faces, remove_smallest_components=False, dtype=np.float64,
+               verbose=False):
+    """
+    Repair a surface mesh with pymeshfix so it can be tetrahedralized.
+
+    Meshes that are already watertight are returned unchanged, and meshes with only
+    a few small planar holes are closed by fill_small_holes, both skipping the repair.
+
+    Args:
+        vertices (ndarray): Nx3 array of vertex coordinates.
+        faces (ndarray): Mx3 array of face indices.
+        remove_smallest_components (bool, optional): Drop all but the largest component during repair.
+        dtype (dtype, optional): Floating point type of the returned vertices.
+        verbose (bool, optional): Forward pymeshfix progress output to this module's logger at DEBUG level.
+
+    Returns:
+        tuple:
+            - vertices (ndarray): Nx3 array of repaired vertex coordinates.
+            - faces (ndarray): Mx3 array of repaired face indices.
+    """
+    # One edge count serves both the watertight check and the hole fill
+    edges = _edge_counts(faces, len(vertices))
+    if is_watertight(vertices, faces, edges):
+        return (np.ascontiguousarray(vertices, dtype=dtype),
+                np.ascontiguousarray(faces, dtype=np.int32))
+
+    filled = None
+    if len(faces) and _uses_all_vertices(faces, len(vertices)):
+        filled = fill_small_holes(vertices, faces, edges=edges)
+    if filled is not None:
+        return (np.ascontiguousarray(vertices, dtype=dtype),
+                np.ascontiguousarray(filled, dtype=np.int32))
+
+    if verbose:
+        with _stdout_to_log():
+            repaired_vertices, repaired_faces = _repair(
+                vertices, faces, True, remove_smallest_components)
+    else:
+        repaired_vertices, repaired_faces = _repair(
+            vertices, faces, False, remove_smallest_components)
+    return (np.ascontiguousarray(repaired_vertices, dtype=dtype),
+            np.ascontiguousarray(repaired_faces, dtype=np.int32))
+
+
+def _as_tetgen_array(array, dtype, name):
+    """
+    Return a C-contiguous array of the given dtype, warning if a copy was needed.
+    """
+    converted = np.ascontiguousarray(array, dtype=dtype)
+    # Identity checks miss views such as unpickled arrays that need no copy
+    if not np.shares_memory(converted, array):
+        warnings.warn(
+            f"{name} passed to TetGen had to be copied to a contiguous {np.dtype(dtype).name} array",
+            stacklevel=3,
+        )
+    return converted
+
+
+def tetrahedralize_mesh(vertices, faces, tetgen_options: dict = None,
+                        quality: Literal["draft", "normal", "fine"] = "normal",
+                        target_cells: int = None, dtype=np.float64):
     """
     Convert a surface mesh to a volumetric tetrahedral mesh using TetGen.
 
@@ -62,43 +552,380 @@ def tetrahedralize_mesh(vertices, faces, tetgen_options: dict = None):
         vertices (ndarray): Nx3 array of surface vertices.
         faces (ndarray): Mx3 array of surface triangle indices.
         tetgen_options (dict, optional): Optional keyword arguments passed to tgen.tetrahedralize().
+                                         Overrides the values of the selected quality preset.
                                          Example: {"maxvolume": 1.0, "mindratio": 1.5}
+        quality (str, optional): TetGen preset, one of "draft", "normal" or "fine".
+        target_cells (int, optional): Approximate number of cells to aim for. Sets maxvolume
+                                      from the bounding box volume so large models are not over-refined.
+                                      Any positive maxvolume also enables TetGen's fixedvolume switch.
+        dtype (dtype, optional): Floating point type of the returned nodes. TetGen always
+                                 computes in float64; float32 input is upcast without a warning.
 
     Returns:
         tuple:
             - node (ndarray): Points of the volumetric mesh.
             - elem (ndarray): Connectivity array (tetrahedrons).
     """
+    if quality not in TETGEN_PRESETS:
+        raise ValueError(f"Unknown quality preset: {quality!r}")
+
+    vertices = np.asarray(vertices)
+    if vertices.dtype == np.float32:
+        vertices = vertices.astype(np.float64)
+    else:
+        vertices = _as_tetgen_array(vertices, np.float64, "vertices")
+    faces = _as_tetgen_array(faces, np.int32, "faces")
+
+    options = dict(TETGEN_PRESETS[quality])
+    if target_cells:
+        bbox_volume = float(np.ptp(vertices, axis=0).prod())
+        options["maxvolume"] = bbox_volume / target_cells
+    options.update(tetgen_options or {})
+    # TetGen ignores maxvolume unless the fixed volume constraint (-a) is switched on
+    if options.get("maxvolume", -1) > 0:
+        options.setdefault("fixedvolume", True)
+
     tgen = tetgen.TetGen(vertices, faces)
-    tetgen_options = tetgen_options or {}
-    tgen.tetrahedralize(**tetgen_options)
-    return tgen.node, tgen.elem
+    tgen.tetrahedralize(**options)
+    return tgen.node.astype(dtype, copy=False), tgen.elem
+
+
+def _vtu_compressed_block(array):
+    """
+    Encode one zlib-compressed appended-data block with its UInt64 size header.
+    """
+    raw = array.tobytes()
+    packed = zlib.compress(raw, level=1)
+    # Single-block zlib header: [#blocks, block size, last block size, compressed size]
+    header = np.array([1, len(raw), len(raw), len(packed)], dtype="<u8")
+    return header.tobytes() + packed
+
+
+def _vtu_header(n_points, n_cells, point_type, block_sizes, compress):
+    """
+    Build the XML part of a VTU file up to the start of the appended data.
+
+    Args:
+        block_sizes (list[int]): Encoded size in bytes of the points, connectivity,
+                                 offsets and types blocks, including their size headers.
+    """
+    names = [("Points", point_type), ("connectivity", "Int32"),
+             ("offsets", "Int32"), ("types", "UInt8")]
+    offsets = np.cumsum([0] + block_sizes[:-1])
+    arrays = []
+    for (name, vtk_type), offset in zip(names, offsets):
+        components = ' NumberOfComponents="3"' if name == "Points" else ""
+        arrays.append(f'<DataArray type="{vtk_type}" Name="{name}"{components} '
+                      f'format="appended" offset="{offset}"/>')
+
+    compressor = ' compressor="vtkZLibDataCompressor"' if compress else ""
+    header = (
+        '<?xml version="1.0"?>\n'
+        f'<VTKFile type="UnstructuredGrid" version="1.0" byte_order="LittleEndian" '
+        f'header_type="UInt64"{compressor}>\n'
+        '<UnstructuredGrid>\n'
+        f'<Piece NumberOfPoints="{n_points}" NumberOfCells="{n_cells}">\n'
+        f'<Points>\n{arrays[0]}\n</Points>\n'
+        f'<Cells>\n{arrays[1]}\n{arrays[2]}\n{arrays[3]}\n</Cells>\n'
+        '</Piece>\n'
+        '</UnstructuredGrid>\n'
+        '<AppendedData encoding="raw">\n_'
+    )
+    return header.encode("ascii")
+
+
+def _check_linear_tetra(cells):
+    # TetGen's 10-node (order=2) cells do not use VTK's quadratic node order
+    if cells.ndim != 2 or cells.shape[1] != 4:
+        raise ValueError(
+            f"Expected an Mx4 array of linear tetrahedra, got shape {cells.shape}; "
+            "use order=1 in tetgen_options")
+
+
+def _point_dtype(nodes):
+    if nodes.dtype == np.float32:
+        return "Float32", np.dtype("<f4")
+    return "Float64", np.dtype("<f8")
+
+
+def write_vtu(nodes, cells, path, compress=False):
+    """
+    Write a tetrahedral mesh as binary VTU without building a meshio.Mesh.
+
+    Points, connectivity, offsets and cell types are written to a raw appended
+    data section straight from the NumPy buffers. Uncompressed output is streamed
+    by write_vtu_streaming; only compressed blocks are built in memory, since their
+    sizes must be known before the header is written.
+
+    Args:
+        nodes (ndarray): Nx3 array of mesh points (float32 or float64).
+        cells (ndarray): Mx4 array of tetrahedral cell indices.
+        path (str): File path for saving the VTU mesh.
+        compress (bool, optional): zlib-compress each data block (level 1).
+
+    Raises:
+        ValueError: If cells are not 4-node tetrahedra.
+    """
+    if not compress:
+        write_vtu_streaming([nodes], [cells], path)
+        return
+
+    _check_linear_tetra(cells)
+    point_type, point_dtype = _point_dtype(nodes)
+    n_cells = len(cells)
+
+    blocks = [
+        _vtu_compressed_block(nodes.astype(point_dtype, copy=False)),
+        _vtu_compressed_block(cells.astype("<i4", copy=False)),
+        _vtu_compressed_block(np.arange(4, 4 * (n_cells + 1), 4, dtype="<i4")),
+        _vtu_compressed_block(np.full(n_cells, VTK_TETRA, dtype="<u1")),
+    ]
+    header = _vtu_header(len(nodes), n_cells, point_type,
+                         [len(block) for block in blocks], compress=True)
+
+    with open(path, "wb") as f:
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+        f.write(b"\n</AppendedData>\n</VTKFile>\n")
 
 
-def save_mesh_to_vtk(nodes, cells, path):
+def write_vtu_streaming(node_parts, cell_parts, path, chunk_rows=VTU_CHUNK_ROWS):
     """
-    Save a volumetric tetrahedral mesh to a VTK file using MeshIO.
+    Write one uncompressed VTU from several meshes, chunk by chunk.
+
+    The parts are never concatenated: each is converted and written in slices
+    of chunk_rows rows, with cell indices offset by the preceding node counts.
+    Peak extra memory is one chunk instead of a full copy of nodes and cells.
+
+    Args:
+        node_parts (list[ndarray]): Nx3 point arrays, one per part.
+        cell_parts (list[ndarray]): Mx4 tetrahedral cell arrays indexing into the matching part.
+        path (str): File path for saving the VTU mesh.
+        chunk_rows (int, optional): Number of rows converted and written at once.
+
+    Raises:
+        ValueError: If cells are not 4-node tetrahedra.
+    """
+    for cells in cell_parts:
+        _check_linear_tetra(cells)
+    point_type, point_dtype = _point_dtype(node_parts[0])
+    n_points = sum(len(nodes) for nodes in node_parts)
+    n_cells = sum(len(cells) for cells in cell_parts)
+    uint64 = np.dtype("<u8").itemsize
+    byte_sizes = [n_points * 3 * point_dtype.itemsize, n_cells * 4 * 4, n_cells * 4, n_cells]
+    header = _vtu_header(n_points, n_cells, point_type,
+                         [uint64 + size for size in byte_sizes], compress=False)
+
+    def size_header(size):
+        return np.array([size], dtype="<u8").tobytes()
+
+    with open(path, "wb") as f:
+        f.write(header)
+
+        f.write(size_header(byte_sizes[0]))
+        for nodes in node_parts:
+            for i in range(0, len(nodes), chunk_rows):
+                f.write(np.ascontiguousarray(nodes[i:i + chunk_rows], dtype=point_dtype))
+
+        f.write(size_header(byte_sizes[1]))
+        node_offset = 0
+        for nodes, cells in zip(node_parts, cell_parts):
+            for i in range(0, len(cells), chunk_rows):
+                f.write((cells[i:i + chunk_rows] + node_offset).astype("<i4"))
+            node_offset += len(nodes)
+
+        f.write(size_header(byte_sizes[2]))
+        for i in range(0, n_cells, chunk_rows):
+            j = min(i + chunk_rows, n_cells)
+            f.write(np.arange(4 * (i + 1), 4 * (j + 1), 4, dtype="<i4"))
+
+        f.write(size_header(byte_sizes[3]))
+        for i in range(0, n_cells, chunk_rows):
+            f.write(np.full(min(chunk_rows, n_cells - i), VTK_TETRA, dtype="<u1"))
+
+        f.write(b"\n</AppendedData>\n</VTKFile>\n")
+
+
+def save_mesh_to_vtk(nodes, cells, path, compress=True, low_memory=False):
+    """
+    Save a volumetric tetrahedral mesh to a binary VTK file.
+
+    Paths ending in ".vtu" are written by write_vtu, which is the preferred format;
+    ".vtk" is written as binary legacy VTK and any other extension is left to MeshIO.
 
     Args:
         nodes (ndarray): Nx3 array of mesh points.
         cells (ndarray): Mx4 array of tetrahedral cell indices.
-        path (str): File path for saving the VTK mesh.
+        path (str): File path for saving the mesh, e.g. "data/output.vtu".
+        compress (bool, optional): zlib-compress the VTU data blocks.
+        low_memory (bool, optional): Stream a ".vtu" chunk by chunk with write_vtu_streaming.
+                                     The output is uncompressed.
+
+    Raises:
+        ValueError: If cells are not 4-node tetrahedra.
     """
-    mesh = meshio.Mesh(points=nodes, cells=[("tetra", cells)])
-    meshio.write(path, mesh)
+    if str(path).lower().endswith(".vtu"):
+        if low_memory:
+            write_vtu_streaming([nodes], [cells], path)
+        else:
+            write_vtu(nodes, cells, path, compress=compress)
+        return
 
+    _check_linear_tetra(cells)
+    mesh = meshio.Mesh(
+        points=nodes,
+        cells=[meshio.CellBlock("tetra", cells.astype(np.int32, copy=False))],
+    )
+    if str(path).lower().endswith(".vtk"):
+        meshio.write(path, mesh, file_format="vtk", binary=True)
+    else:
+        meshio.write(path, mesh)
 
-def stl_to_vtk(stl_data, output_path, tetgen_options: dict = None):
+
+def _group_overlapping(lo, hi):
+    """
+    Group components whose axis-aligned bounding boxes overlap.
+
+    Nested shells (e.g. the inner wall of a hollow part) overlap their outer
+    shell and must stay together, otherwise TetGen would fill the cavity.
+    Uses a sort-and-sweep along x, so only boxes overlapping in x are compared.
+
+    Args:
+        lo (ndarray): Kx3 array of bounding box minima.
+        hi (ndarray): Kx3 array of bounding box maxima.
+
+    Returns:
+        ndarray: Group id for every component.
+    """
+    parent = np.arange(len(lo))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    active = np.empty(0, dtype=np.intp)
+    for i in np.argsort(lo[:, 0], kind="stable"):
+        active = active[hi[active, 0] >= lo[i, 0]]
+        overlapping = active[np.all(lo[active, 1:] <= hi[i, 1:], axis=1)
+                             & np.all(lo[i, 1:] <= hi[active, 1:], axis=1)]
+        for j in overlapping:
+            parent[find(j)] = find(i)
+        active = np.append(active, i)
+
+    return np.array([find(i) for i in range(len(lo))])
+
+
+def split_bodies(vertices, faces):
+    """
+    Split a surface mesh into independent bodies that can be meshed separately.
+
+    Connected components are found on the vertex graph; components with
+    overlapping bounding boxes are kept in the same body.
+
+    Args:
+        vertices (ndarray): Nx3 array of vertex coordinates.
+        faces (ndarray): Mx3 array of face indices.
+
+    Returns:
+        list[tuple]: (vertices, faces) pair for every body, with faces reindexed locally.
+    """
+    n = len(vertices)
+    rows = faces[:, [0, 1, 2]].ravel()
+    cols = faces[:, [1, 2, 0]].ravel()
+    adjacency = scipy.sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    n_components, labels = scipy.sparse.csgraph.connected_components(
+        adjacency, directed=False)
+    if n_components == 1:
+        return [(vertices, faces)]
+
+    # Only components that own faces matter; isolated vertices are dropped
+    _, face_components = np.unique(labels[faces[:, 0]], return_inverse=True)
+    face_components = face_components.reshape(-1)
+    corner_components = np.repeat(face_components, 3)
+    order = np.argsort(corner_components, kind="stable")
+    corners = vertices[faces.ravel()[order]]
+    starts = np.flatnonzero(np.diff(corner_components[order], prepend=-1))
+    lo = np.minimum.reduceat(corners, starts, axis=0)
+    hi = np.maximum.reduceat(corners, starts, axis=0)
+
+    face_groups = _group_overlapping(lo, hi)[face_components]
+    order = np.argsort(face_groups, kind="stable")
+    splits = np.flatnonzero(np.diff(face_groups[order])) + 1
+
+    bodies = []
+    for face_index in np.split(order, splits):
+        used, local_faces = np.unique(faces[face_index], return_inverse=True)
+        bodies.append((vertices[used],
+                       local_faces.reshape(-1, 3).astype(np.int32)))
+    return bodies
+
+
+def _mesh_body(vertices, faces, tetgen_options, quality, repair, dtype):
+    if repair:
+        vertices, faces = clean_mesh(vertices, faces, dtype=dtype)
+    return tetrahedralize_mesh(vertices, faces, tetgen_options,
+                               quality=quality, dtype=dtype)
+
+
+def stl_to_vtk(stl_data, output_path, tetgen_options: dict = None,
+               quality: Literal["draft", "normal", "fine"] = "normal",
+               target_cells: int = None, repair: bool = True,
+               max_workers: int = None, dtype=np.float32, low_memory: bool = False):
     """
     Complete pipeline to convert STL surface mesh data to a volumetric VTK file.
 
+    Disconnected bodies are repaired and tetrahedralized in parallel worker
+    processes, then merged into a single mesh. Where the default start method is
+    spawn (Windows, macOS), call this from under an ``if __name__ == "__main__":`` guard.
+
     Args:
         stl_data (bytes): Raw STL file content (binary).
-        output_path (str): File path for saving the VTK mesh. Default is "data/output.vtk".
+        output_path (str): File path for saving the VTK mesh, e.g. "data/output.vtu".
         tetgen_options (dict, optional): Parameters for controlling TetGen behavior.
+        quality (str, optional): TetGen preset, one of "draft", "normal" or "fine".
+        target_cells (int, optional): Approximate number of cells to aim for.
+        repair (bool, optional): Run clean_mesh before meshing. Set to False only for input
+                                 known to be watertight; no repair is done at all then.
+        max_workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+        dtype (dtype, optional): Floating point type carried through the pipeline and written
+                                 to the output. Defaults to float32, matching STL precision.
+        low_memory (bool, optional): Write the bodies straight to an uncompressed VTU chunk by chunk
+                                     instead of merging them into one array first (.vtu only).
     """
     vertices, faces = create_2d_mesh(stl_data)
-    clean_vertices, clean_faces = clean_mesh(vertices, faces)
-    nodes, cells = tetrahedralize_mesh(
-        clean_vertices, clean_faces, tetgen_options)
-    save_mesh_to_vtk(nodes, cells, output_path)
\ No newline at end of file
+    del stl_data
+    vertices = vertices.astype(dtype, copy=False)
+
+    # Resolve the size target on the whole model so every body shares the same maxvolume
+    options = dict(tetgen_options or {})
+    if target_cells and "maxvolume" not in options:
+        options["maxvolume"] = float(np.ptp(vertices, axis=0).prod()) / target_cells
+        options["fixedvolume"] = True
+
+    bodies = split_bodies(vertices, faces)
+    del vertices, faces
+    if len(bodies) == 1:
+        results = [_mesh_body(*bodies[0], options, quality, repair, dtype)]
+    else:
+        workers = min(max_workers or os.cpu_count() or 1, len(bodies))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_mesh_body, v, f, options, quality, repair, dtype)
+                       for v, f in bodies]
+            results = [future.result() for future in futures]
+    del bodies
+
+    if low_memory and str(output_path).lower().endswith(".vtu"):
+        write_vtu_streaming([nodes for nodes, _ in results],
+                            [cells for _, cells in results], output_path)
+        return
+
+    offsets = np.cumsum([0] + [len(nodes) for nodes, _ in results[:-1]])
+    nodes = np.concatenate([nodes for nodes, _ in results])
+    cells = np.concatenate([cells + offset
+                            for (_, cells), offset in zip(results, offsets)])
+    del results
+    save_mesh_to_vtk(nodes, cells, output_path)
@@ -9,21 +9,46 @@ part studios are programmatically retrieved from Onshape and converted into usab
 
 Functions:
 - create_session: Initializes an authenticated session with custom headers.
+- get_session: Returns a cached, connection-pooled session for a set of credentials.
+- create_http2_client: Initializes an authenticated HTTP/2 client (requires httpx with h2).
 - fetch_step_content: Downloads raw STEP content from Onshape part studio.
+- fetch_step_content_http2: Same as fetch_step_content, over an HTTP/2 httpx client.
 - export_step: High-level function that retrieves STEP bytes for an entire part studio.
+- export_step_to_path: Streams the STEP export of a part studio directly to a file.
 
 Author: Marvin Frommer
 Date: 2025-07-27
 """
 
+import contextlib
 import logging
 import requests
 import os
+import time
+from io import BytesIO
+from typing import BinaryIO
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from src.constants import BASE_URL, STEP_HEADERS
+from src.constants import BASE_URL, STEP_HEADERS, STREAM_CHUNK_SIZE
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_SESSION_CACHE: dict[tuple[str, str], requests.Session] = {}
+_CLIENT_CACHE: dict[tuple[str, str], "httpx.Client"] = {}
+
 
 def create_session(access_key: str, secret_key: str, headers: dict) -> requests.Session:
     """
@@ -40,9 +65,148 @@ def create_session(access_key: str, secret_key: str, headers: dict) -> requests.
     session = requests.Session()
     session.auth = (access_key, secret_key)
     session.headers.update(headers)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF_FACTOR,
+                          status_forcelist=list(RETRY_STATUS_CODES)),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
     return session
 
 
+def get_session(access_key: str, secret_key: str) -> requests.Session:
+    """
+    Return a session for the given credentials, reusing it across calls.
+
+    Keeping one session per key pair lets repeated exports reuse keep-alive
+    connections instead of paying a new TCP/TLS handshake every time.
+
+    Args:
+        access_key (str): Onshape API access key.
+        secret_key (str): Onshape API secret key.
+
+    Returns:
+        requests.Session: Cached session configured with STEP_HEADERS.
+    """
+    key = (access_key, secret_key)
+    session = _SESSION_CACHE.get(key)
+    if session is None:
+        logger.debug("Creating session for part studio export.")
+        session = create_session(access_key, secret_key, STEP_HEADERS)
+        _SESSION_CACHE[key] = session
+    return session
+
+
+if HTTP2_AVAILABLE:
+    class _RetryTransport(httpx.HTTPTransport):
+        """
+        HTTP/2 transport that retries throttled and gateway error responses like the
+        urllib3 Retry of create_session; httpx itself only retries failed connects.
+        """
+
+        def handle_request(self, request):
+            for attempt in range(RETRY_TOTAL):
+                response = super().handle_request(request)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                response.close()
+                delay = RETRY_BACKOFF_FACTOR * 2 ** attempt
+                logger.warning(f"Got {response.status_code} from {request.url}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+            return super().handle_request(request)
+
+
+def create_http2_client(access_key: str, secret_key: str, headers: dict) -> "httpx.Client":
+    """
+    Create an authenticated HTTP/2 client using Onshape API credentials.
+
+    Args:
+        access_key (str): Onshape API access key.
+        secret_key (str): Onshape API secret key.
+        headers (dict): Headers to apply to every request.
+
+    Returns:
+        httpx.Client: Configured client with credentials and headers.
+
+    Raises:
+        RuntimeError: If httpx or h2 is not installed.
+    """
+    if not HTTP2_AVAILABLE:
+        raise RuntimeError("HTTP/2 support requires 'httpx' and 'h2' to be installed.")
+
+    return httpx.Client(
+        http2=True,
+        auth=(access_key, secret_key),
+        headers=headers,
+        timeout=httpx.Timeout(60.0, read=600.0),
+        transport=_RetryTransport(
+            http2=True,
+            retries=RETRY_TOTAL,
+            limits=httpx.Limits(max_keepalive_connections=8),
+        ),
+    )
+
+
+def _step_export_url(document_id: str, wv_type: str, wv_id: str, element_id: str, base_url: str) -> str:
+    return f"{base_url}/partstudios/d/{document_id}/{wv_type}/{wv_id}/e/{element_id}/export/step"
+
+
+def _write_step_content(url: str, session: requests.Session, out: BinaryIO) -> None:
+    try:
+        response = session.get(url, allow_redirects=False)
+        response.raise_for_status()
+
+        if response.status_code in (302, 307):
+            redirect_url = response.headers.get("Location")
+            if not redirect_url:
+                raise RuntimeError("Redirect expected but 'Location' header is missing.")
+
+            logger.info(f"Following redirect to: {redirect_url}")
+            with session.get(redirect_url, stream=True) as step_response:
+                step_response.raise_for_status()
+                # iter_content decodes gzip and maps urllib3 errors to RequestException
+                for chunk in step_response.iter_content(STREAM_CHUNK_SIZE):
+                    out.write(chunk)
+
+            logger.info("STEP content fetched successfully.")
+        else:
+            raise RuntimeError(f"Unexpected response status code: {response.status_code}")
+
+    except requests.RequestException as e:
+        logger.error(f"Failed to fetch STEP content: {e}")
+        raise RuntimeError("Failed to fetch STEP content.") from e
+
+
+def _write_step_content_http2(url: str, client: "httpx.Client", out: BinaryIO) -> None:
+    try:
+        response = client.get(url, follow_redirects=False)
+
+        if response.status_code in (302, 307):
+            redirect_url = response.headers.get("Location")
+            if not redirect_url:
+                raise RuntimeError("Redirect expected but 'Location' header is missing.")
+
+            logger.info(f"Following redirect to: {redirect_url}")
+            with client.stream("GET", redirect_url) as step_response:
+                step_response.raise_for_status()
+                for chunk in step_response.iter_bytes(chunk_size=STREAM_CHUNK_SIZE):
+                    out.write(chunk)
+
+            logger.info("STEP content fetched successfully.")
+        else:
+            # httpx raises on every non-2xx status, so only check once the redirect is ruled out
+            response.raise_for_status()
+            raise RuntimeError(f"Unexpected response status code: {response.status_code}")
+
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch STEP content: {e}")
+        raise RuntimeError("Failed to fetch STEP content.") from e
+
+
 def fetch_step_content(
     document_id: str,
     wv_type: str,
@@ -68,29 +232,51 @@ def fetch_step_content(
     Raises:
         RuntimeError: If STEP download fails or no redirect is provided.
     """
-    url = f"{base_url}/partstudios/d/{document_id}/{wv_type}/{wv_id}/e/{element_id}/export/step"
+    url = _step_export_url(document_id, wv_type, wv_id, element_id, base_url)
+    buffer = BytesIO()
+    _write_step_content(url, session, buffer)
+    return buffer.getvalue()
 
-    try:
-        response = session.get(url, allow_redirects=False)
-        response.raise_for_status()
 
-        if response.status_code in (302, 307):
-            redirect_url = response.headers.get("Location")
-            if not redirect_url:
-                raise RuntimeError("Redirect expected but 'Location' header is missing.")
+def fetch_step_content_http2(
+    document_id: str,
+    wv_type: str,
+    wv_id: str,
+    element_id: str,
+    client: "httpx.Client",
+    base_url: str = BASE_URL,
+) -> bytes:
+    """
+    Download STEP geometry data for an entire part studio over HTTP/2.
 
-            logger.info(f"Following redirect to: {redirect_url}")
-            step_response = session.get(redirect_url)
-            step_response.raise_for_status()
+    Args:
+        document_id (str): Onshape document ID.
+        wv_type (str): Type of identifier ('w' for workspace, 'v' for version, 'm' for microversion).
+        wv_id (str): The workspace/version/microversion ID.
+        element_id (str): Onshape element (tab) ID for the part studio.
+        client (httpx.Client): Authenticated HTTP/2 client.
+        base_url (str, optional): Onshape API base URL.
 
-            logger.info("STEP content fetched successfully.")
-            return step_response.content
-        else:
-            raise RuntimeError(f"Unexpected response status code: {response.status_code}")
+    Returns:
+        bytes: The binary STEP data.
 
-    except requests.RequestException as e:
-        logger.error(f"Failed to fetch STEP content: {e}")
-        raise RuntimeError("Failed to fetch STEP content.") from e
+    Raises:
+        RuntimeError: If STEP download fails or no redirect is provided.
+    """
+    url = _step_export_url(document_id, wv_type, wv_id, element_id, base_url)
+    buffer = BytesIO()
+    _write_step_content_http2(url, client, buffer)
+    return buffer.getvalue()
+
+
+def _get_http2_client(access_key: str, secret_key: str) -> "httpx.Client":
+    key = (access_key, secret_key)
+    client = _CLIENT_CACHE.get(key)
+    if client is None:
+        logger.debug("Creating HTTP/2 client for part studio export.")
+        client = create_http2_client(access_key, secret_key, STEP_HEADERS)
+        _CLIENT_CACHE[key] = client
+    return client
 
 
 def export_step(
@@ -104,6 +290,9 @@ def export_step(
     """
     High-level function to retrieve STEP content for an entire part studio.
 
+    Uses an HTTP/2 httpx client when httpx and h2 are installed, and falls back
+    to a pooled requests session otherwise.
+
     Args:
         document_id (str): Onshape document ID.
         wv_type (str): 'w', 'v', or 'm' to specify workspace, version, or microversion.
@@ -118,7 +307,69 @@ def export_step(
     Raises:
         RuntimeError: If the STEP content cannot be retrieved.
     """
-    logger.debug("Creating session for part studio export.")
-    session = create_session(access_key, secret_key, STEP_HEADERS)
+    if HTTP2_AVAILABLE:
+        client = _get_http2_client(access_key, secret_key)
+        return fetch_step_content_http2(document_id, wv_type, wv_id, element_id, client)
+
+    session = get_session(access_key, secret_key)
     content = fetch_step_content(document_id, wv_type, wv_id, element_id, session)
     return content
+
+
+def export_step_to_path(
+    document_id: str,
+    wv_type: str,
+    wv_id: str,
+    element_id: str,
+    access_key: str,
+    secret_key: str,
+    out_path: str,
+    base_url: str = BASE_URL,
+) -> str:
+    """
+    Stream STEP content for an entire part studio straight to a file on disk.
+
+    STEP readers (OCC, Netgen) take a file path, so writing once avoids holding
+    the whole download in memory. The data goes to a ".part" file next to out_path
+    that is renamed into place only once the download has succeeded, so a failed
+    export never leaves a truncated STEP file behind.
+
+    Args:
+        document_id (str): Onshape document ID.
+        wv_type (str): 'w', 'v', or 'm' to specify workspace, version, or microversion.
+        wv_id (str): Corresponding workspace/version/microversion ID.
+        element_id (str): Element ID of the part studio to export.
+        access_key (str): Onshape access key.
+        secret_key (str): Onshape secret key.
+        out_path (str): Destination file path for the STEP data.
+        base_url (str, optional): Onshape API base URL.
+
+    Returns:
+        str: The path the STEP file was written to.
+
+    Raises:
+        RuntimeError: If the STEP content cannot be retrieved.
+    """
+    url = _step_export_url(document_id, wv_type, wv_id, element_id, base_url)
+    part_path = f"{out_path}.part"
+
+    try:
+        with open(part_path, "wb") as f:
+            if HTTP2_AVAILABLE:
+                _write_step_content_http2(url, _get_http2_client(access_key, secret_key), f)
+            else:
+                _write_step_content(url, get_session(access_key, secret_key), f)
+
+            if hasattr(os, "posix_fadvise"):
+                # Near no-op hint: DONTNEED only evicts pages that are already clean, and most
+                # of a fresh download is still dirty here. Syncing first would make it effective
+                # but costs a blocking flush to disk, which is not worth it for a file read once.
+                f.flush()
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        os.replace(part_path, out_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(part_path)
+        raise
+
+    return out_path
@@ -0,0 +1,8 @@
+# The other test_*.py files are manual scripts that need Onshape credentials or Netgen
+collect_ignore = [
+    "mesh_vis.py",
+    "test_api_caller.py",
+    "test_step_to_mesh.py",
+    "test_stl_to_vtk.py",
+    "visualize_vtk.py",
+]
@@ -0,0 +1,228 @@
+import pickle
+import subprocess
+import sys
+import warnings
+from pathlib import Path
+
+import meshio
+import numpy as np
+import pytest
+import trimesh
+
+from src import stl_converter
+
+
+def _icosphere():
+    mesh = trimesh.creation.icosphere()
+    return np.asarray(mesh.vertices), np.asarray(mesh.faces, dtype=np.int32)
+
+
+def test_target_cells_refines_mesh():
+    vertices, faces = _icosphere()
+    _, default_cells = stl_converter.tetrahedralize_mesh(vertices, faces)
+    _, target_cells = stl_converter.tetrahedralize_mesh(vertices, faces, target_cells=50000)
+    assert len(target_cells) > 5 * len(default_cells)
+
+
+def test_tetrahedralize_accepts_lists():
+    vertices, faces = _icosphere()
+    with pytest.warns(UserWarning, match="faces passed to TetGen"):
+        nodes, cells = stl_converter.tetrahedralize_mesh(vertices.tolist(), faces.tolist())
+    assert len(nodes) >= len(vertices) and len(cells) > 0
+
+
+def test_split_bodies_keeps_nested_shells_together():
+    parts = []
+    for offset in (0.0, 5.0):
+        part = trimesh.creation.icosphere(subdivisions=1)
+        part.apply_translation([offset, 0.0, 0.0])
+        parts.append(part)
+    inner = trimesh.creation.icosphere(subdivisions=1)
+    inner.apply_scale(0.5)
+    parts.append(inner)
+    mesh = trimesh.util.concatenate(parts)
+
+    bodies = stl_converter.split_bodies(np.asarray(mesh.vertices), np.asarray(mesh.faces))
+
+    assert sorted(len(faces) for _, faces in bodies) == [80, 160]
+    for vertices, faces in bodies:
+        assert stl_converter.is_watertight(vertices, faces)
+
+
+@pytest.mark.skipif(not stl_converter.NUMBA_AVAILABLE, reason="numba not installed")
+def test_weld_backends_agree():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-10, 10, size=(300, 3))
+    vertices = points[rng.integers(0, len(points), size=3000)]
+    eps = 20 * stl_converter.WELD_TOLERANCE
+
+    remap_numba, _ = stl_converter._weld_kernel(vertices, eps)
+    remap_numpy, _ = stl_converter._weld_numpy(vertices, eps)
+
+    # Same partition of the vertices, up to the numbering of the groups
+    pairs = np.unique(np.column_stack([remap_numba, remap_numpy]), axis=0)
+    assert len(pairs) == len(np.unique(remap_numba)) == len(np.unique(remap_numpy)) == len(points)
+
+
+def test_weld_with_fine_eps_keeps_distant_vertices():
+    # The second triangle is shifted by exactly 2**21 grid cells, where 21-bit Morton keys wrap around
+    triangle = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=np.float64)
+    vertices = np.concatenate([triangle, triangle + [2**21 * 1e-3 + 5e-4, 0, 0]])
+    faces = np.array([[0, 1, 2], [3, 4, 5]])
+    welded_vertices, welded_faces = stl_converter.weld_vertices(vertices, faces, eps=1e-3)
+    assert len(welded_vertices) == 6
+    assert len(welded_faces) == 2
+
+
+def _tet_mesh():
+    vertices, faces = _icosphere()
+    return stl_converter.tetrahedralize_mesh(vertices, faces)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_write_vtu_round_trip(tmp_path, compress):
+    nodes, cells = _tet_mesh()
+    path = tmp_path / "mesh.vtu"
+    stl_converter.write_vtu(nodes, cells, str(path), compress=compress)
+    mesh = meshio.read(path)
+    np.testing.assert_array_equal(mesh.points, nodes)
+    np.testing.assert_array_equal(mesh.cells_dict["tetra"], cells)
+
+
+@pytest.mark.parametrize("suffix", [".vtk", ".msh"])
+def test_save_mesh_leaves_other_formats_to_meshio(tmp_path, suffix):
+    nodes, cells = _tet_mesh()
+    path = tmp_path / f"mesh{suffix}"
+    stl_converter.save_mesh_to_vtk(nodes, cells, str(path))
+    mesh = meshio.read(path)
+    np.testing.assert_allclose(mesh.points, nodes)
+    np.testing.assert_array_equal(mesh.cells_dict["tetra"], cells)
+
+
+def test_write_vtu_streaming_merges_parts(tmp_path):
+    nodes, cells = _tet_mesh()
+    shifted = nodes.astype(np.float32) + np.float32(10)
+    path = tmp_path / "mesh.vtu"
+    stl_converter.write_vtu_streaming([nodes.astype(np.float32), shifted], [cells, cells],
+                                      str(path), chunk_rows=100)
+    mesh = meshio.read(path)
+    assert mesh.points.dtype == np.float32
+    np.testing.assert_array_equal(mesh.points, np.concatenate([nodes.astype(np.float32), shifted]))
+    np.testing.assert_array_equal(mesh.cells_dict["tetra"], np.concatenate([cells, cells + len(nodes)]))
+
+
+def test_write_vtu_rejects_quadratic_cells(tmp_path):
+    vertices, faces = _icosphere()
+    nodes, cells = stl_converter.tetrahedralize_mesh(vertices, faces, {"order": 2})
+    assert cells.shape[1] == 10
+    with pytest.raises(ValueError):
+        stl_converter.write_vtu(nodes, cells, str(tmp_path / "mesh.vtu"))
+
+
+def test_fill_small_holes_closes_planar_hole():
+    box = trimesh.creation.box()
+    vertices, faces = np.asarray(box.vertices), np.asarray(box.faces)
+    open_faces = faces[box.face_normals[:, 2] < 0.9]
+    assert not stl_converter.is_watertight(vertices, open_faces)
+
+    filled = stl_converter.fill_small_holes(vertices, open_faces)
+
+    assert stl_converter.is_watertight(vertices, filled)
+    closed = trimesh.Trimesh(vertices, filled, process=False)
+    assert closed.is_winding_consistent
+    assert np.isclose(closed.volume, box.volume)
+
+
+def test_fill_small_holes_rejects_non_planar_hole():
+    sphere = trimesh.creation.icosphere(subdivisions=2)
+    vertices, faces = np.asarray(sphere.vertices), np.asarray(sphere.faces)
+    # Cutting away the x > 0, z > 0 quarter leaves a hole whose rim is bent along y
+    centers = sphere.triangles_center
+    quarter = (centers[:, 0] > 0) & (centers[:, 2] > 0)
+    loops = stl_converter._boundary_loops(faces[~quarter])
+    assert len(loops) == 1
+    assert stl_converter.fill_small_holes(vertices, faces[~quarter]) is None
+
+
+def test_verbose_repair_logs_to_stdout_handler_without_feedback():
+    # Run in a subprocess: pytest's own capturing replaces sys.stdout, which hides the loop
+    script = """
+import logging, sys
+import numpy as np, trimesh
+from src import stl_converter
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG, format="LOG %(message)s")
+sphere = trimesh.creation.icosphere()
+faces = np.asarray(sphere.faces)
+# Drop a few faces and duplicate others so the fast paths fail and pymeshfix runs
+broken = np.concatenate([faces[5:], faces[5:8]])
+stl_converter.clean_mesh(np.asarray(sphere.vertices), broken, verbose=True)
+"""
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                            cwd=Path(__file__).resolve().parents[1], timeout=120)
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert any(line.startswith("LOG ") for line in lines)
+    assert not any(line.startswith("LOG LOG") for line in lines)
+
+
+def test_tetrahedralize_keeps_surface_vertices_first():
+    vertices, faces = _icosphere()
+    nodes, _ = stl_converter.tetrahedralize_mesh(vertices, faces)
+    np.testing.assert_allclose(nodes[:len(vertices)], vertices)
+
+
+def test_as_tetgen_array_warns_only_on_copy():
+    faces = pickle.loads(pickle.dumps(np.arange(12, dtype=np.int32).reshape(4, 3)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        stl_converter._as_tetgen_array(faces, np.int32, "faces")
+    with pytest.warns(UserWarning, match="faces passed to TetGen"):
+        stl_converter._as_tetgen_array(faces.astype(np.int64), np.int32, "faces")
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_stl_to_vtk_merges_bodies(tmp_path, low_memory):
+    bodies = [trimesh.creation.icosphere(subdivisions=1) for _ in range(2)]
+    bodies[1].apply_translation([5.0, 0.0, 0.0])
+    stl_data = trimesh.util.concatenate(bodies).export(file_type="stl")
+    path = tmp_path / "mesh.vtu"
+    stl_converter.stl_to_vtk(stl_data, str(path), max_workers=2, low_memory=low_memory)
+
+    mesh = meshio.read(path)
+    cells = mesh.cells_dict["tetra"]
+    second = mesh.points[:, 0] > 2.5
+    # Each body's nodes form one contiguous block and its cells index only that block
+    assert np.count_nonzero(np.diff(second.astype(np.int8))) == 1
+    assert np.all(second[cells] == second[cells[:, :1]])
+    assert set(second[cells[:, 0]]) == {False, True}
+
+
+def _trimesh_counts(stl_data):
+    mesh = trimesh.load(trimesh.util.wrap_as_stream(stl_data), file_type="stl")
+    return len(mesh.vertices), len(mesh.faces)
+
+
+def test_create_2d_mesh_reads_binary_with_solid_header():
+    stl_data = bytearray(trimesh.creation.icosphere().export(file_type="stl"))
+    stl_data[:80] = b"solid binary".ljust(80)
+    vertices, faces = stl_converter.create_2d_mesh(bytes(stl_data))
+    assert (len(vertices), len(faces)) == _trimesh_counts(bytes(stl_data))
+
+
+def test_create_2d_mesh_reads_ascii():
+    stl_data = trimesh.creation.icosphere().export(file_type="stl_ascii").encode()
+    vertices, faces = stl_converter.create_2d_mesh(stl_data)
+    assert (len(vertices), len(faces)) == _trimesh_counts(stl_data)
+
+
+def test_create_2d_mesh_falls_back_to_trimesh(monkeypatch):
+    ascii_stl = trimesh.creation.icosphere().export(file_type="stl_ascii")
+    # The regex parser is case-sensitive, so one upper-case keyword leaves it a partial triangle
+    stl_data = ascii_stl.replace("vertex", "VERTEX", 1).encode()
+    expected = _trimesh_counts(stl_data)
+    calls = []
+    load = trimesh.load
+    monkeypatch.setattr(trimesh, "load", lambda *args, **kwargs: calls.append(1) or load(*args, **kwargs))
+    vertices, faces = stl_converter.create_2d_mesh(stl_data)
+    assert calls
+    assert (len(vertices), len(faces)) == expected
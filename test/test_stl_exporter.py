@@ -0,0 +1,116 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from src import stl_exporter
+
+STEP_BODY = b"ISO-10303-21;\n" + b"x" * 100000 + b"\nEND-ISO-10303-21;\n"
+
+
+class _OnshapeHandler(BaseHTTPRequestHandler):
+    """Answers the export endpoint with a 307 and serves the STEP body at /download."""
+
+    def do_GET(self):
+        if self.path.endswith("/export/step"):
+            self.send_response(307)
+            self.send_header("Location", f"http://127.0.0.1:{self.server.server_port}/download")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/download" and self.server.failures_left:
+            self.server.failures_left -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/download" and not self.server.fail_download:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(STEP_BODY)))
+            self.end_headers()
+            # A truncated download announces the full length but sends only part of it
+            self.wfile.write(STEP_BODY[:1000] if self.server.truncate_download else STEP_BODY)
+        else:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), _OnshapeHandler)
+    httpd.fail_download = False
+    httpd.failures_left = 0
+    httpd.truncate_download = False
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _base_url(httpd):
+    return f"http://127.0.0.1:{httpd.server_port}/api"
+
+
+def test_fetch_step_content_follows_redirect(server):
+    session = stl_exporter.create_session("key", "secret", {})
+    content = stl_exporter.fetch_step_content("d", "w", "w", "e", session, base_url=_base_url(server))
+    assert content == STEP_BODY
+
+
+def test_fetch_step_content_raises_on_truncated_body(server):
+    server.truncate_download = True
+    session = stl_exporter.create_session("key", "secret", {})
+    with pytest.raises(RuntimeError, match="Failed to fetch STEP content"):
+        stl_exporter.fetch_step_content("d", "w", "w", "e", session, base_url=_base_url(server))
+
+
+@pytest.mark.skipif(not stl_exporter.HTTP2_AVAILABLE, reason="httpx/h2 not installed")
+def test_fetch_step_content_http2_raises_on_truncated_body(server):
+    server.truncate_download = True
+    with stl_exporter.create_http2_client("key", "secret", {}) as client:
+        with pytest.raises(RuntimeError, match="Failed to fetch STEP content"):
+            stl_exporter.fetch_step_content_http2("d", "w", "w", "e", client, base_url=_base_url(server))
+
+
+@pytest.mark.skipif(not stl_exporter.HTTP2_AVAILABLE, reason="httpx/h2 not installed")
+def test_fetch_step_content_http2_follows_redirect(server):
+    with stl_exporter.create_http2_client("key", "secret", {}) as client:
+        content = stl_exporter.fetch_step_content_http2("d", "w", "w", "e", client, base_url=_base_url(server))
+    assert content == STEP_BODY
+
+
+@pytest.mark.skipif(not stl_exporter.HTTP2_AVAILABLE, reason="httpx/h2 not installed")
+def test_fetch_step_content_http2_retries_unavailable(server):
+    server.failures_left = 2
+    with stl_exporter.create_http2_client("key", "secret", {}) as client:
+        content = stl_exporter.fetch_step_content_http2("d", "w", "w", "e", client, base_url=_base_url(server))
+    assert content == STEP_BODY
+    assert server.failures_left == 0
+
+
+@pytest.mark.skipif(not stl_exporter.HTTP2_AVAILABLE, reason="httpx/h2 not installed")
+def test_fetch_step_content_http2_raises_on_error(server):
+    server.fail_download = True
+    with stl_exporter.create_http2_client("key", "secret", {}) as client:
+        with pytest.raises(RuntimeError):
+            stl_exporter.fetch_step_content_http2("d", "w", "w", "e", client, base_url=_base_url(server))
+
+
+def test_export_step_to_path_writes_file(server, tmp_path):
+    out_path = tmp_path / "part.step"
+    stl_exporter.export_step_to_path("d", "w", "w", "e", "key", "secret", str(out_path),
+                                     base_url=_base_url(server))
+    assert out_path.read_bytes() == STEP_BODY
+    assert list(tmp_path.iterdir()) == [out_path]
+
+
+def test_export_step_to_path_leaves_no_file_on_failure(server, tmp_path):
+    server.fail_download = True
+    out_path = tmp_path / "part.step"
+    with pytest.raises(RuntimeError):
+        stl_exporter.export_step_to_path("d", "w", "w", "e", "key", "secret", str(out_path),
+                                         base_url=_base_url(server))
+    assert list(tmp_path.iterdir()) == []
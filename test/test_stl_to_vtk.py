@@ -19,4 +19,4 @@ if __name__ == "__main__":
     stl = load_stl(part_name, document_id, workspace_id,
                    element_id, access_key, secret_key)
 
-    stl_to_vtk(stl, "data/DA_mesh.vtk")
+    stl_to_vtk(stl, "data/DA_mesh.vtu")
@@ -1,7 +1,7 @@
 import pyvista as pv
 
 # Load the VTK file using PyVista
-pv_mesh = pv.read("data/DA_mesh.vtk")
+pv_mesh = pv.read("data/DA_mesh.vtu")
 
 # Plot the volumetric mesh
 pv_mesh.plot(show_edges=True)